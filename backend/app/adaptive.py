@@ -0,0 +1,77 @@
+import numpy as np
+
+# Likert scale used by every question
+RESPONSE_VALUES = np.arange(1, 6)
+
+
+class AdaptiveQuestionnaire:
+    """
+    Decides, from a partial set of answers, whether the K-Means cluster is already fixed.
+
+    K-Means assigns the nearest centroid by squared distance, which is a sum of independent
+    per-question terms. So for every pair of clusters (j, k) the margin d_j - d_k is a fixed
+    part from the answered questions plus one term per unanswered question, and its exact
+    maximum and minimum over all remaining 1-5 answers is a sum of per-question extremes.
+    Those per-question tables are precomputed once per model, which keeps each call to a
+    few small array operations.
+    """
+
+    def __init__(self, model):
+        centroids = np.asarray(model.cluster_centers_, dtype=np.float64)
+        self.n_clusters, self.n_questions = centroids.shape
+
+        # contributions[j, q, v] = (v - c_jq)^2, centroid j's distance term for answering v to question q
+        self.contributions = (RESPONSE_VALUES[None, None, :] - centroids[:, :, None]) ** 2
+        # margins[j, k, q, v]: how much answering v to q moves d_j - d_k
+        self.margins = self.contributions[:, None, :, :] - self.contributions[None, :, :, :]
+        self.margin_max = self.margins.max(axis=3)
+        self.margin_min = self.margins.min(axis=3)
+        self.other = ~np.eye(self.n_clusters, dtype=bool)
+
+    def _parse(self, answers: dict):
+        """Splits {question_id: value} (1-based ids) into index arrays, validating the ranges."""
+        questions = []
+        values = []
+        for question_id, value in answers.items():
+            if not 1 <= question_id <= self.n_questions:
+                raise ValueError(f"Question {question_id} does not exist.")
+            if not 1 <= value <= 5:
+                raise ValueError(f"Response {value} for question {question_id} must be between 1 and 5.")
+            questions.append(question_id - 1)
+            values.append(value - 1)
+        answered = np.zeros(self.n_questions, dtype=bool)
+        answered[questions] = True
+        return np.array(questions, dtype=int), np.array(values, dtype=int), answered
+
+    def evaluate(self, answers: dict):
+        """
+        Returns (cluster_index, next_question_index, possible_cluster_indices), all 0-based.
+        cluster_index is set once every completion of the remaining answers gives the same
+        cluster; otherwise next_question_index is the unanswered question expected to leave
+        the fewest possible clusters.
+        """
+        questions, values, answered = self._parse(answers)
+        fixed = self.margins[:, :, questions, values].sum(axis=2)
+        unanswered = ~answered
+        remaining_max = self.margin_max[:, :, unanswered].sum(axis=2)
+        remaining_min = self.margin_min[:, :, unanswered].sum(axis=2)
+
+        # Cluster j is determined when d_j < d_k for every k even in its worst case
+        determined = np.all((fixed + remaining_max < 0) | ~self.other, axis=1)
+        # Cluster j is still possible while, against every k, its best case margin is not positive
+        possible = np.flatnonzero(np.all((fixed + remaining_min <= 0) | ~self.other, axis=1))
+        if determined.any():
+            return int(np.flatnonzero(determined)[0]), None, possible.tolist()
+        if not unanswered.any():
+            # Only exact ties remain; K-Means picks the lowest index among the nearest
+            distances = self.contributions[:, questions, values].sum(axis=1)
+            return int(np.argmin(distances)), None, possible.tolist()
+
+        # Look one answer ahead for every unanswered question and value
+        candidates = np.flatnonzero(unanswered)
+        # Shapes: (questions, values, j, k)
+        next_fixed = fixed[None, None, :, :] + self.margins[:, :, candidates, :].transpose(2, 3, 0, 1)
+        next_min = remaining_min[None, :, :] - self.margin_min[:, :, candidates].transpose(2, 0, 1)
+        still_possible = np.all((next_fixed + next_min[:, None, :, :] <= 0) | ~self.other, axis=3)
+        expected_possible = still_possible.sum(axis=2).mean(axis=1)
+        return None, int(candidates[np.argmin(expected_possible)]), possible.tolist()
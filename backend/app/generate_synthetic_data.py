@@ -80,6 +80,20 @@ def generate_responses(archetype_name, archetype_data):
         responses.append(user_responses)
     return responses
 
+def generate_response_matrix(seed=None):
+    """
+    Generates synthetic responses for every archetype as one (users x 15) matrix.
+    Vectorized counterpart of generate_responses; a fixed seed makes the output reproducible.
+    """
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for archetype_data in ARCHETYPES.values():
+        means = np.array(archetype_data["means"], dtype=np.float64)
+        noise = rng.normal(0, archetype_data["std_dev"], size=(archetype_data["num_users"], len(QUESTIONS_TEXT)))
+        # Round and clip to the 1-5 range, as generate_responses does
+        blocks.append(np.clip(np.round(means + noise), 1, 5).astype(int))
+    return np.vstack(blocks)
+
 def store_questions_in_db(db: Session):
     """Stores the predefined questions in the database if they don't exist."""
     for i, text in enumerate(QUESTIONS_TEXT):
@@ -16,13 +16,14 @@ POPULAR_GAMES = {
     "Star Wars: The Old Republic", "The Elder Scrolls: Legends"
 }
 
-# Drop and recreate tables to apply schema changes
-print("Dropping and recreating tables to apply schema changes...")
-# Drop recommendations first due to foreign key constraint
-models.Recommendation.__table__.drop(engine, checkfirst=True)
-models.Game.__table__.drop(engine, checkfirst=True)
-models.Base.metadata.create_all(bind=engine)
-print("Tables recreated.")
+def recreate_game_tables():
+    """Drops and recreates the games tables to apply schema changes."""
+    print("Dropping and recreating tables to apply schema changes...")
+    # Drop recommendations first due to foreign key constraint
+    models.Recommendation.__table__.drop(engine, checkfirst=True)
+    models.Game.__table__.drop(engine, checkfirst=True)
+    models.Base.metadata.create_all(bind=engine)
+    print("Tables recreated.")
 
 def get_games_from_api():
     """Fetches game data from the FreeToGame API."""
@@ -35,6 +36,40 @@ def get_games_from_api():
         print(f"Error fetching games from API: {e}")
         return None
 
+def translate_text(text: str):
+    """Translates text to Korean. Raises on translator errors."""
+    return GoogleTranslator(source='auto', target='ko').translate(text)
+
+def translate_description(game_data: dict):
+    """Translates a game's short description to Korean, falling back to the original on failure."""
+    original_description = game_data.get('short_description', '')
+    if not original_description:
+        return original_description
+    try:
+        translated_description = translate_text(original_description)
+        print(f"Translated '{game_data.get('title')}': {original_description[:30]}... -> {translated_description[:30]}...")
+        return translated_description
+    except Exception as e:
+        print(f"Could not translate description for '{game_data.get('title')}'. Using original. Error: {e}")
+        return original_description
+
+def build_game_fields(game_data: dict, translated_description: str):
+    """Maps a FreeToGame API entry to Game column values."""
+    return {
+        "freetogame_id": game_data.get('id'),
+        "title": game_data.get('title'),
+        "thumbnail": game_data.get('thumbnail'),
+        "short_description": translated_description,
+        "game_url": game_data.get('game_url'),
+        "genre": game_data.get('genre'),
+        "platform": game_data.get('platform'),
+        "publisher": game_data.get('publisher'),
+        "developer": game_data.get('developer'),
+        "release_date": game_data.get('release_date'),
+        "profile_url": game_data.get('profile_url'),
+        "is_popular": game_data.get('title') in POPULAR_GAMES,
+    }
+
 def ingest_games_to_db(db: Session, games_data: list):
     """Ingests game data into the database, with translation and popularity flag."""
     if not games_data:
@@ -53,32 +88,8 @@ def ingest_games_to_db(db: Session, games_data: list):
             if existing_game:
                 continue
 
-            original_description = game_data.get('short_description', '')
-            translated_description = original_description
-            if original_description:
-                try:
-                    translated_description = GoogleTranslator(source='auto', target='ko').translate(original_description)
-                    print(f"Translated '{game_data.get('title')}': {original_description[:30]}... -> {translated_description[:30]}...")
-                except Exception as e:
-                    print(f"Could not translate description for '{game_data.get('title')}'. Using original. Error: {e}")
-                    translated_description = original_description
-
-            is_popular = game_data.get('title') in POPULAR_GAMES
-
-            game = models.Game(
-                freetogame_id=game_data.get('id'),
-                title=game_data.get('title'),
-                thumbnail=game_data.get('thumbnail'),
-                short_description=translated_description,
-                game_url=game_data.get('game_url'),
-                genre=game_data.get('genre'),
-                platform=game_data.get('platform'),
-                publisher=game_data.get('publisher'),
-                developer=game_data.get('developer'),
-                release_date=game_data.get('release_date'),
-                profile_url=game_data.get('profile_url'),
-                is_popular=is_popular
-            )
+            translated_description = translate_description(game_data)
+            game = models.Game(**build_game_fields(game_data, translated_description))
             db.add(game)
             db.commit()
             db.refresh(game)
@@ -92,6 +103,7 @@ def ingest_games_to_db(db: Session, games_data: list):
     print(f"Successfully ingested {added_count} new games.")
 
 if __name__ == "__main__":
+    recreate_game_tables()
     db = SessionLocal()
     try:
         print("Fetching games from API and ingesting into database...")
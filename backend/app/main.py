@@ -5,6 +5,7 @@ from sqlalchemy import func
 from . import models, schemas
 from .database import SessionLocal, engine
 from .update_cluster_info import CLUSTER_DEFINITIONS
+from .adaptive import AdaptiveQuestionnaire
 import joblib
 import numpy as np
 import pandas as pd
@@ -50,6 +51,52 @@ try:
 except Exception as e:
     print(f"Error loading K-Means model: {e}")
 
+# Written by pipeline.py. When present, it takes precedence over MODEL_PATH and the clusters table.
+# Running train_model.py directly removes it, so the manual workflow applies again after a restart.
+PUBLISHED_MANIFEST_PATH = "ml_models/published.json"
+# (manifest mtime, model, {cluster_id: cluster data}), replaced as a whole so requests see one consistent version
+published_snapshot = None
+# mtime of a manifest that failed to load, so it is not retried on every request
+published_failed_mtime = None
+
+def get_published_snapshot():
+    """
+    Returns the published model and cluster profiles, reloading them when the manifest changes.
+    If a new manifest cannot be loaded, the previous snapshot stays in use; with no previous
+    snapshot this returns None and the API falls back to MODEL_PATH and the clusters table.
+    """
+    global published_snapshot, published_failed_mtime
+    try:
+        mtime = os.stat(PUBLISHED_MANIFEST_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    snapshot = published_snapshot
+    if (snapshot is None or snapshot[0] != mtime) and mtime != published_failed_mtime:
+        try:
+            with open(PUBLISHED_MANIFEST_PATH, encoding="utf-8") as f:
+                manifest = json.load(f)
+            model = joblib.load(manifest["model_path"])
+            clusters = {cluster["id"]: cluster for cluster in manifest["clusters"]}
+        except Exception as e:
+            print(f"Error loading published model from {PUBLISHED_MANIFEST_PATH}: {e}")
+            published_failed_mtime = mtime
+            return snapshot
+        snapshot = (mtime, model, clusters)
+        published_snapshot = snapshot
+        print(f"Loaded published model {manifest['model_hash'][:12]}.")
+    return snapshot
+
+# Precomputed tables for the adaptive questionnaire, rebuilt when the model changes
+adaptive_questionnaire = None
+
+def get_adaptive_questionnaire(model):
+    global adaptive_questionnaire
+    questionnaire = adaptive_questionnaire
+    if questionnaire is None or questionnaire[0] is not model:
+        questionnaire = (model, AdaptiveQuestionnaire(model))
+        adaptive_questionnaire = questionnaire
+    return questionnaire[1]
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Game Recommender API!"}
@@ -61,7 +108,12 @@ def get_questions(db: Session = Depends(get_db)):
 
 @app.post("/recommend/", response_model=schemas.RecommendationResult)
 def recommend_games(user_input: schemas.UserResponseInput, db: Session = Depends(get_db)):
-    if kmeans_model is None:
+    snapshot = get_published_snapshot()
+    if snapshot is not None:
+        _, model, published_clusters = snapshot
+    else:
+        model, published_clusters = kmeans_model, None
+    if model is None:
         raise HTTPException(status_code=500, detail="K-Means model not loaded.")
 
     # 1. Preprocess user responses
@@ -71,15 +123,27 @@ def recommend_games(user_input: schemas.UserResponseInput, db: Session = Depends
     ]).reshape(1, -1)
 
     # 2. Predict the cluster
-    cluster_id_predicted = int(kmeans_model.predict(user_response_vector)[0]) + 1
-
-    # 3. Retrieve cluster details from the database
-    cluster_profile = db.query(models.Cluster).filter(models.Cluster.id == cluster_id_predicted).first()
-    if not cluster_profile:
-        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id_predicted} not found.")
+    cluster_id_predicted = int(model.predict(user_response_vector)[0]) + 1
+
+    # 3. Retrieve cluster details from the published snapshot, or the database otherwise
+    if published_clusters is not None:
+        cluster_definition = published_clusters.get(cluster_id_predicted)
+        if not cluster_definition:
+            raise HTTPException(status_code=404, detail=f"Cluster {cluster_id_predicted} not found.")
+        profile = schemas.Cluster(
+            id=cluster_definition["id"],
+            name=cluster_definition["name"],
+            description=cluster_definition["description"],
+            centroid_values=cluster_definition["centroid_values"],
+        )
+    else:
+        cluster_profile = db.query(models.Cluster).filter(models.Cluster.id == cluster_id_predicted).first()
+        if not cluster_profile:
+            raise HTTPException(status_code=404, detail=f"Cluster {cluster_id_predicted} not found.")
+        profile = schemas.Cluster.from_orm(cluster_profile)
+        cluster_definition = CLUSTER_DEFINITIONS.get(cluster_id_predicted)
 
-    # 4. Get genre recommendations from CLUSTER_DEFINITIONS
-    cluster_definition = CLUSTER_DEFINITIONS.get(cluster_id_predicted)
+    # 4. Get genre recommendations (published with the clusters, or from CLUSTER_DEFINITIONS)
     if not cluster_definition:
         raise HTTPException(status_code=404, detail=f"Recommendation definition for cluster {cluster_id_predicted} not found.")
 
@@ -108,7 +172,31 @@ def recommend_games(user_input: schemas.UserResponseInput, db: Session = Depends
         recommended_games.extend(other_games)
 
     return schemas.RecommendationResult(
-        profile=schemas.Cluster.from_orm(cluster_profile),
+        profile=profile,
         recommended_games=[schemas.Game.from_orm(game) for game in recommended_games],
         recommendation_reason=recommendation_reason
-    )
\ No newline at end of file
+    )
+
+@app.post("/questionnaire/next/", response_model=schemas.AdaptiveQuestionResult)
+def next_question(user_input: schemas.UserResponseInput):
+    """
+    Takes the answers so far and returns either the final cluster, once no combination of
+    remaining answers can change it, or the most informative question to ask next.
+    """
+    snapshot = get_published_snapshot()
+    model = snapshot[1] if snapshot is not None else kmeans_model
+    if model is None:
+        raise HTTPException(status_code=500, detail="K-Means model not loaded.")
+
+    response_dict = {res.question_id: res.response_value for res in user_input.responses if res.response_value is not None}
+    try:
+        cluster_index, question_index, possible = get_adaptive_questionnaire(model).evaluate(response_dict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return schemas.AdaptiveQuestionResult(
+        cluster_id=cluster_index + 1 if cluster_index is not None else None,
+        next_question_id=question_index + 1 if question_index is not None else None,
+        candidate_cluster_ids=[i + 1 for i in possible],
+        answered_count=len(response_dict),
+    )
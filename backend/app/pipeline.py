@@ -0,0 +1,422 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import joblib
+import numpy as np
+import sklearn
+
+from . import generate_synthetic_data, ingest_games, models, train_model, update_cluster_info
+from .database import SessionLocal, engine
+from .generate_synthetic_data import ARCHETYPES, QUESTIONS_TEXT, generate_response_matrix, store_questions_in_db
+from .ingest_games import POPULAR_GAMES, build_game_fields, get_games_from_api, translate_text
+from .train_model import NUM_CLUSTERS, fit_kmeans_model
+from .update_cluster_info import CLUSTER_DEFINITIONS
+
+# Content-addressed pipeline: generate -> train -> label, plus games, then one publish.
+# Each stage's outputs live in CACHE_DIR/<stage>/<key>/, where key hashes the stage's
+# code, its declared inputs and the content of its upstream outputs.
+PIPELINE_DIR = "ml_models/pipeline"
+CACHE_DIR = os.path.join(PIPELINE_DIR, "cache")
+PUBLISHED_MODELS_DIR = "ml_models/published"
+PUBLISHED_MANIFEST_PATH = "ml_models/published.json"
+# Side cache shared by every games stage run rather than a stage output: it only memoizes
+# successful translations by source text, and games.json already holds the translated text.
+TRANSLATIONS_PATH = os.path.join(PIPELINE_DIR, "translations.json")
+STAGE_MANIFEST = "stage.json"
+LATEST_MANIFEST = "latest.json"
+SYNTHETIC_SEED = 42
+# Published synthetic responses use this session prefix, so a refresh replaces only them
+SYNTHETIC_SESSION_PREFIX = "synthetic-"
+
+
+def hash_bytes(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_json(value):
+    return hash_bytes(json.dumps(value, sort_keys=True, ensure_ascii=False, default=list).encode("utf-8"))
+
+
+def write_json_atomic(path: str, value):
+    """Writes JSON to a temporary file and renames it over path, so readers never see a partial file."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Stage:
+    """
+    A pipeline step. inputs maps names to values (or zero-argument callables resolved
+    just before hashing); deps names upstream stages; outputs lists the files run writes.
+    code lists the modules or functions run relies on; their source is part of the key,
+    so editing them reruns the stage.
+    run(inputs, upstream_dirs, out_dir) receives the resolved inputs and upstream output dirs.
+    It may return False to mark its outputs as usable but incomplete, so the next run redoes it.
+    With fallback_to_last, a failure reuses the stage's last successful outputs instead.
+    """
+
+    def __init__(self, name, run, outputs, inputs=None, deps=(), code=(), fallback_to_last=False):
+        self.name = name
+        self.fallback_to_last = fallback_to_last
+        self.run = run
+        self.outputs = outputs
+        self.inputs = inputs or {}
+        self.deps = tuple(deps)
+        self.code = (run,) + tuple(code)
+
+    def resolve_inputs(self):
+        return {key: value() if callable(value) else value for key, value in self.inputs.items()}
+
+    def cache_key(self, resolved_inputs, upstream_hashes):
+        return hash_json({
+            "stage": self.name,
+            "code": [hash_bytes(inspect.getsource(obj).encode("utf-8")) for obj in self.code],
+            "inputs": hash_json(resolved_inputs),
+            "upstream": upstream_hashes,
+        })
+
+
+# --- Stage implementations ---
+
+def run_generate(inputs, upstream_dirs, out_dir):
+    responses = generate_response_matrix(inputs["seed"])
+    np.save(os.path.join(out_dir, "responses.npy"), responses)
+    print(f"Generated {len(responses)} synthetic response vectors.")
+
+
+def run_train(inputs, upstream_dirs, out_dir):
+    responses = np.load(os.path.join(upstream_dirs["generate"], "responses.npy"))
+    kmeans = fit_kmeans_model(responses)
+    joblib.dump(kmeans, os.path.join(out_dir, "kmeans_model.pkl"))
+
+
+def run_label(inputs, upstream_dirs, out_dir):
+    kmeans = joblib.load(os.path.join(upstream_dirs["train"], "kmeans_model.pkl"))
+    definitions = inputs["definitions"]
+    clusters = []
+    for i, centroid in enumerate(kmeans.cluster_centers_):
+        cluster_id = i + 1
+        definition = definitions.get(cluster_id)
+        if definition is None:
+            raise ValueError(f"No entry in CLUSTER_DEFINITIONS for cluster {cluster_id}.")
+        clusters.append({
+            "id": cluster_id,
+            "name": definition["name"],
+            "description": definition["description"],
+            "genres": definition["genres"],
+            "reason": definition["reason"],
+            "centroid_values": json.dumps(centroid.tolist()),
+        })
+    with open(os.path.join(out_dir, "clusters.json"), "w", encoding="utf-8") as f:
+        json.dump(clusters, f, ensure_ascii=False, indent=2)
+
+
+def fetch_games_payload():
+    games = get_games_from_api()
+    if games is None:
+        raise RuntimeError("Could not fetch games from the FreeToGame API.")
+    return games
+
+
+def run_games(inputs, upstream_dirs, out_dir):
+    # Translations are memoized by source text, so a changed catalog only translates new descriptions
+    translations = {}
+    if os.path.exists(TRANSLATIONS_PATH):
+        with open(TRANSLATIONS_PATH, encoding="utf-8") as f:
+            translations = json.load(f)
+
+    games = []
+    failed = 0
+    for game_data in inputs["payload"]:
+        original_description = game_data.get('short_description', '')
+        text_hash = hash_bytes(original_description.encode("utf-8"))
+        description = translations.get(text_hash)
+        if description is None:
+            description = original_description
+            if original_description:
+                try:
+                    description = translate_text(original_description)
+                    # Only successful translations are cached, so failures are retried next run
+                    translations[text_hash] = description
+                except Exception as e:
+                    failed += 1
+                    print(f"Could not translate description for '{game_data.get('title')}'. Using original. Error: {e}")
+        games.append(build_game_fields(game_data, description))
+
+    write_json_atomic(TRANSLATIONS_PATH, translations)
+    with open(os.path.join(out_dir, "games.json"), "w", encoding="utf-8") as f:
+        json.dump(games, f, ensure_ascii=False, indent=2)
+    print(f"Prepared {len(games)} games ({failed} descriptions left untranslated).")
+    return failed == 0
+
+
+def build_stages(seed: int = SYNTHETIC_SEED):
+    return [
+        Stage("generate", run_generate, ["responses.npy"],
+              inputs={"archetypes": ARCHETYPES, "questions": QUESTIONS_TEXT, "seed": seed,
+                      "numpy": np.__version__},
+              code=[generate_synthetic_data]),
+        Stage("train", run_train, ["kmeans_model.pkl"],
+              inputs={"num_clusters": NUM_CLUSTERS, "numpy": np.__version__, "sklearn": sklearn.__version__},
+              deps=["generate"], code=[train_model]),
+        Stage("label", run_label, ["clusters.json"],
+              inputs={"definitions": CLUSTER_DEFINITIONS}, deps=["train"], code=[update_cluster_info]),
+        Stage("games", run_games, ["games.json"],
+              inputs={"payload": fetch_games_payload, "popular_games": sorted(POPULAR_GAMES)},
+              code=[ingest_games], fallback_to_last=True),
+    ]
+
+
+# --- Runner ---
+
+def execute_stage(stage: Stage, completed: dict, force: bool = False):
+    """
+    Runs one stage unless a finished cache entry with the same key exists.
+    Returns {"dir": output dir, "outputs": {file: content hash}, "skipped": bool}.
+    """
+    try:
+        return _execute_stage(stage, completed, force)
+    except Exception as e:
+        latest_path = os.path.join(CACHE_DIR, stage.name, LATEST_MANIFEST)
+        if not stage.fallback_to_last or not os.path.exists(latest_path):
+            raise
+        with open(latest_path, encoding="utf-8") as f:
+            latest = json.load(f)
+        print(f"[{stage.name}] failed ({e}); reusing last successful outputs ({latest['key'][:12]}).")
+        return {"dir": latest["dir"], "outputs": latest["outputs"], "skipped": True}
+
+
+def _execute_stage(stage: Stage, completed: dict, force: bool):
+    upstream_dirs = {dep: completed[dep]["dir"] for dep in stage.deps}
+    upstream_hashes = {dep: completed[dep]["outputs"] for dep in stage.deps}
+    resolved_inputs = stage.resolve_inputs()
+    key = stage.cache_key(resolved_inputs, upstream_hashes)
+    out_dir = os.path.join(CACHE_DIR, stage.name, key)
+    manifest_path = os.path.join(out_dir, STAGE_MANIFEST)
+
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("complete", True):
+            print(f"[{stage.name}] unchanged ({key[:12]}), skipping.")
+            return {"dir": out_dir, "outputs": manifest["outputs"], "skipped": True}
+
+    # Build into a scratch directory and rename it into place once complete
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    print(f"[{stage.name}] running ({key[:12]})...")
+    start = time.perf_counter()
+    complete = stage.run(resolved_inputs, upstream_dirs, tmp_dir) is not False
+
+    outputs = {}
+    for output in stage.outputs:
+        path = os.path.join(tmp_dir, output)
+        if not os.path.exists(path):
+            raise RuntimeError(f"Stage '{stage.name}' did not produce declared output '{output}'.")
+        outputs[output] = hash_file(path)
+    write_json_atomic(os.path.join(tmp_dir, STAGE_MANIFEST), {"key": key, "outputs": outputs, "complete": complete})
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    write_json_atomic(os.path.join(CACHE_DIR, stage.name, LATEST_MANIFEST), {"key": key, "dir": out_dir, "outputs": outputs})
+    status = "done" if complete else "done with incomplete outputs, will rerun next time,"
+    print(f"[{stage.name}] {status} in {time.perf_counter() - start:.1f}s.")
+    return {"dir": out_dir, "outputs": outputs, "skipped": False}
+
+
+def sort_stages(stages):
+    """Returns the stages topologically sorted so every stage comes after its dependencies."""
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'.")
+
+    ordered = []
+    placed = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if all(dep in placed for dep in stage.deps)]
+        if not ready:
+            raise ValueError("Stage dependencies contain a cycle.")
+        for stage in ready:
+            ordered.append(stage)
+            placed.add(stage.name)
+        remaining = [stage for stage in remaining if stage.name not in placed]
+    return ordered
+
+
+def run_stages(stages, force=(), max_workers: int = None):
+    """
+    Runs stages in dependency order; stages whose dependencies are all done run in parallel.
+    A failed stage only stops the stages that depend on it. Returns (completed, failed),
+    where failed maps stage names to the exception or to the failed dependency's name.
+    """
+    # In dependency order, one pass marks every stage downstream of a failure
+    stages = sort_stages(stages)
+
+    completed = {}
+    failed = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages)) as executor:
+        while len(completed) + len(failed) < len(stages):
+            for stage in stages:
+                if stage.name in completed or stage.name in failed or stage.name in running.values():
+                    continue
+                failed_dep = next((dep for dep in stage.deps if dep in failed), None)
+                if failed_dep is not None:
+                    print(f"[{stage.name}] not run because '{failed_dep}' failed.")
+                    failed[stage.name] = failed_dep
+                elif all(dep in completed for dep in stage.deps):
+                    future = executor.submit(execute_stage, stage, dict(completed), stage.name in force)
+                    running[future] = stage.name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    completed[name] = future.result()
+                except Exception as e:
+                    print(f"[{name}] failed: {e}")
+                    failed[name] = e
+    return completed, failed
+
+
+# --- Publish ---
+
+def load_published_manifest():
+    if not os.path.exists(PUBLISHED_MANIFEST_PATH):
+        return None
+    with open(PUBLISHED_MANIFEST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def publish(results: dict):
+    """
+    Publishes the pipeline results. The DB (questions, synthetic responses, clusters and
+    games) is refreshed in a single transaction, and the API switches to the new model and
+    cluster profiles together when the manifest is renamed into place, so /recommend/ never
+    sees unlabeled clusters or a mismatched model. Without a games result the published
+    games are left as they are.
+    """
+    previous = load_published_manifest() or {}
+    responses_hash = results["generate"]["outputs"]["responses.npy"]
+    model_hash = results["train"]["outputs"]["kmeans_model.pkl"]
+    clusters_hash = results["label"]["outputs"]["clusters.json"]
+    games_hash = results["games"]["outputs"]["games.json"] if "games" in results else previous.get("games_hash")
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        # Questions are static and only inserted when missing, so this runs on every publish
+        store_questions_in_db(db)
+    finally:
+        db.close()
+
+    published = (previous.get("responses_hash"), previous.get("model_hash"), previous.get("clusters_hash"), previous.get("games_hash"))
+    if published == (responses_hash, model_hash, clusters_hash, games_hash):
+        print("Published results are already up to date.")
+        return
+
+    with open(os.path.join(results["label"]["dir"], "clusters.json"), encoding="utf-8") as f:
+        clusters = json.load(f)
+    games = None
+    if "games" in results and previous.get("games_hash") != games_hash:
+        with open(os.path.join(results["games"]["dir"], "games.json"), encoding="utf-8") as f:
+            games = json.load(f)
+
+    # Model files are stored by content hash, so the manifest can point at them safely
+    os.makedirs(PUBLISHED_MODELS_DIR, exist_ok=True)
+    model_path = os.path.join(PUBLISHED_MODELS_DIR, f"{model_hash}.pkl")
+    if not os.path.exists(model_path):
+        tmp_path = f"{model_path}.tmp-{os.getpid()}"
+        shutil.copyfile(os.path.join(results["train"]["dir"], "kmeans_model.pkl"), tmp_path)
+        os.replace(tmp_path, model_path)
+
+    db = SessionLocal()
+    try:
+        if previous.get("responses_hash") != responses_hash:
+            # Training data is published too, so /questions/ and shadow_score's DB replay see it
+            responses = np.load(os.path.join(results["generate"]["dir"], "responses.npy"))
+            db.query(models.UserResponse).filter(
+                models.UserResponse.session_id.startswith(SYNTHETIC_SESSION_PREFIX)
+            ).delete(synchronize_session=False)
+            db.execute(models.UserResponse.__table__.insert(), [
+                {
+                    "session_id": f"{SYNTHETIC_SESSION_PREFIX}{row:06d}",
+                    "question_id": question + 1,
+                    "response_value": int(value),
+                }
+                for row, user_responses in enumerate(responses)
+                for question, value in enumerate(user_responses)
+            ])
+
+        # Recommendations reference both clusters and games, so they are cleared first
+        db.query(models.Recommendation).delete()
+        if previous.get("clusters_hash") != clusters_hash:
+            db.query(models.Cluster).delete()
+            for cluster in clusters:
+                db.add(models.Cluster(
+                    id=cluster["id"],
+                    name=cluster["name"],
+                    description=cluster["description"],
+                    centroid_values=cluster["centroid_values"],
+                ))
+        if games is not None:
+            db.query(models.Game).delete()
+            db.add_all(models.Game(**game) for game in games)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    write_json_atomic(PUBLISHED_MANIFEST_PATH, {
+        "model_path": model_path,
+        "responses_hash": responses_hash,
+        "model_hash": model_hash,
+        "clusters_hash": clusters_hash,
+        "games_hash": games_hash,
+        "clusters": clusters,
+        "published_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    })
+    games_note = f"{len(games)} games" if games is not None else "unchanged games"
+    print(f"Published model {model_hash[:12]} with {len(clusters)} clusters and {games_note}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the generate -> train -> label and games stages, then publish.")
+    parser.add_argument("--force", nargs="*", default=[], help="Stage names to rerun even if unchanged")
+    parser.add_argument("--seed", type=int, default=SYNTHETIC_SEED, help="Seed for synthetic data generation")
+    parser.add_argument("--no-publish", action="store_true", help="Build stage outputs without publishing them")
+    parser.add_argument("--skip-games", action="store_true", help="Do not fetch games; the published games are kept")
+    args = parser.parse_args()
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    stages = [stage for stage in build_stages(args.seed) if not (args.skip_games and stage.name == "games")]
+    results, failures = run_stages(stages, force=set(args.force))
+    if not args.no_publish:
+        if any(name in failures for name in ("generate", "train", "label")):
+            print("Not publishing because a model stage failed.")
+        else:
+            publish(results)
+    if failures:
+        raise SystemExit(1)
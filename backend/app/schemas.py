@@ -71,3 +71,11 @@ class RecommendationResult(BaseModel):
     profile: Cluster
     recommended_games: List[Game]
     recommendation_reason: str
+
+class AdaptiveQuestionResult(BaseModel):
+    # Set once the remaining answers can no longer change the cluster
+    cluster_id: Optional[int] = None
+    # Otherwise, the question to ask next
+    next_question_id: Optional[int] = None
+    candidate_cluster_ids: List[int]
+    answered_count: int
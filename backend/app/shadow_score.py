@@ -0,0 +1,270 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from threadpoolctl import threadpool_limits
+
+from . import models
+from .database import SessionLocal
+from .generate_synthetic_data import ARCHETYPES, QUESTIONS_TEXT
+from .pipeline import load_published_manifest
+
+# Offline shadow scoring: replay stored questionnaire vectors against the
+# current model and a candidate model before promoting the candidate.
+CURRENT_MODEL_PATH = "ml_models/kmeans_model.pkl"
+NUM_QUESTIONS = len(QUESTIONS_TEXT)
+DEFAULT_RESPONSE = 3  # Same default recommend_games uses for unanswered questions
+DEFAULT_CHUNK_SIZE = 50_000
+SINGLE_PREDICT_SAMPLES = 200
+
+# Models are loaded once per worker process by _init_worker
+_worker_models = {}
+
+
+def iter_synthetic_chunks(total_vectors: int, chunk_size: int, seed: int = 42):
+    """
+    Yields synthetic response vectors in chunks, drawn from the same archetypes
+    as generate_synthetic_data.py but without going through the database.
+    Only one chunk is held in memory at a time.
+    """
+    means = np.array([a["means"] for a in ARCHETYPES.values()], dtype=np.float64)
+    std_devs = np.array([a["std_dev"] for a in ARCHETYPES.values()], dtype=np.float64)
+    weights = np.array([a["num_users"] for a in ARCHETYPES.values()], dtype=np.float64)
+    weights /= weights.sum()
+
+    rng = np.random.default_rng(seed)
+    remaining = total_vectors
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        archetype_idx = rng.choice(len(means), size=n, p=weights)
+        noise = rng.standard_normal((n, NUM_QUESTIONS)) * std_devs[archetype_idx, None]
+        # Round and clip to the 1-5 range, as generate_responses does
+        chunk = np.clip(np.rint(means[archetype_idx] + noise), 1, 5).astype(np.int8)
+        yield chunk
+        remaining -= n
+
+
+def iter_db_chunks(db, chunk_size: int):
+    """
+    Streams logged submissions from the user_responses table as response vectors.
+    Rows are read with a server-side cursor ordered by session, so memory stays
+    bounded by chunk_size regardless of table size. Unanswered questions are
+    filled with DEFAULT_RESPONSE, matching what /recommend/ would have scored.
+    """
+    query = (
+        db.query(models.UserResponse.session_id, models.UserResponse.question_id, models.UserResponse.response_value)
+        .order_by(models.UserResponse.session_id, models.UserResponse.question_id)
+        .execution_options(stream_results=True)
+        .yield_per(chunk_size * NUM_QUESTIONS)
+    )
+
+    chunk = np.full((chunk_size, NUM_QUESTIONS), DEFAULT_RESPONSE, dtype=np.int8)
+    row = -1
+    current_session = None
+    for session_id, question_id, response_value in query:
+        if session_id != current_session:
+            current_session = session_id
+            row += 1
+            if row == chunk_size:
+                yield chunk
+                chunk = np.full((chunk_size, NUM_QUESTIONS), DEFAULT_RESPONSE, dtype=np.int8)
+                row = 0
+        if 1 <= question_id <= NUM_QUESTIONS and response_value is not None:
+            chunk[row, question_id - 1] = response_value
+    if row >= 0:
+        yield chunk[:row + 1]
+
+
+def _init_worker(current_path: str, candidate_path: str):
+    """Loads both models once per worker and pins BLAS/OpenMP to one thread to avoid oversubscription."""
+    _worker_models["current"] = joblib.load(current_path)
+    _worker_models["candidate"] = joblib.load(candidate_path)
+    _worker_models["limits"] = threadpool_limits(limits=1)
+
+
+def _score_chunk(chunk: np.ndarray):
+    """
+    Scores one chunk against both models and returns only aggregates:
+    a flattened churn count matrix and the predict wall time for each model.
+    """
+    current = _worker_models["current"]
+    candidate = _worker_models["candidate"]
+    vectors = chunk.astype(np.float64)
+
+    start = time.perf_counter()
+    current_labels = current.predict(vectors)
+    current_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate_labels = candidate.predict(vectors)
+    candidate_seconds = time.perf_counter() - start
+
+    k_candidate = candidate.n_clusters
+    churn = np.bincount(
+        current_labels * k_candidate + candidate_labels,
+        minlength=current.n_clusters * k_candidate,
+    )
+    return churn, len(chunk), current_seconds, candidate_seconds
+
+
+def measure_single_predict_latency(model, vectors: np.ndarray):
+    """Times one-row predict calls, the way /recommend/ calls the model. Returns seconds per call."""
+    timings = []
+    with threadpool_limits(limits=1):
+        for vector in vectors.astype(np.float64):
+            start = time.perf_counter()
+            model.predict(vector.reshape(1, -1))
+            timings.append(time.perf_counter() - start)
+    return np.array(timings)
+
+
+def align_clusters(current, candidate):
+    """
+    Matches candidate clusters to current clusters by minimum total centroid distance.
+    Retraining can permute cluster indices, so this separates real movement from relabeling.
+    Returns a dict {candidate_index: current_index}.
+    """
+    distances = np.linalg.norm(
+        candidate.cluster_centers_[:, None, :] - current.cluster_centers_[None, :, :], axis=2
+    )
+    candidate_idx, current_idx = linear_sum_assignment(distances)
+    return dict(zip(candidate_idx.tolist(), current_idx.tolist()))
+
+
+def shadow_score(chunks, current_path: str, candidate_path: str, workers: int = None):
+    """
+    Scores every chunk against the current and candidate models in a process pool.
+    At most 2 * workers chunks are in flight, so memory does not grow with input size.
+    Returns a dict with the churn matrix, vector count, and timing figures.
+    """
+    current = joblib.load(current_path)
+    candidate = joblib.load(candidate_path)
+    workers = workers or os.cpu_count() or 1
+
+    churn = np.zeros(current.n_clusters * candidate.n_clusters, dtype=np.int64)
+    total_vectors = 0
+    chunk_seconds = {"current": [], "candidate": []}
+    single_latency = None
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(current_path, candidate_path)
+    ) as executor:
+        pending = deque()
+
+        def collect(future):
+            nonlocal total_vectors
+            chunk_churn, n, current_seconds, candidate_seconds = future.result()
+            churn[:] += chunk_churn
+            total_vectors += n
+            chunk_seconds["current"].append((n, current_seconds))
+            chunk_seconds["candidate"].append((n, candidate_seconds))
+
+        for chunk in chunks:
+            if single_latency is None and len(chunk):
+                sample = chunk[:SINGLE_PREDICT_SAMPLES]
+                single_latency = {
+                    "current": measure_single_predict_latency(current, sample),
+                    "candidate": measure_single_predict_latency(candidate, sample),
+                }
+            pending.append(executor.submit(_score_chunk, chunk))
+            if len(pending) >= workers * 2:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    elapsed = time.perf_counter() - start
+
+    return {
+        "churn": churn.reshape(current.n_clusters, candidate.n_clusters),
+        "total_vectors": total_vectors,
+        "elapsed_seconds": elapsed,
+        "chunk_seconds": chunk_seconds,
+        "single_latency": single_latency,
+        "alignment": align_clusters(current, candidate),
+    }
+
+
+def print_report(result: dict):
+    """Prints churn, population shift, and throughput/latency figures."""
+    churn = result["churn"]
+    total = result["total_vectors"]
+    if total == 0:
+        print("No vectors were scored.")
+        return
+
+    k_current, k_candidate = churn.shape
+    # Cluster IDs are 1-based everywhere else in the app
+    print(f"\nScored {total:,} vectors.")
+    print("\nChurn matrix (rows: current cluster, columns: candidate cluster):")
+    print("        " + "".join(f"{j + 1:>10}" for j in range(k_candidate)))
+    for i in range(k_current):
+        print(f"{i + 1:>8}" + "".join(f"{churn[i, j]:>10,}" for j in range(k_candidate)))
+
+    same_id = np.trace(churn[:min(k_current, k_candidate), :min(k_current, k_candidate)])
+    print(f"\nUsers changing cluster ID: {total - same_id:,} ({(total - same_id) / total:.2%})")
+    alignment = result["alignment"]
+    aligned_same = sum(churn[cur, cand] for cand, cur in alignment.items())
+    print(f"Users changing cluster after centroid alignment: {total - aligned_same:,} ({(total - aligned_same) / total:.2%})")
+    relabeled = {cand + 1: cur + 1 for cand, cur in alignment.items() if cand != cur}
+    if relabeled:
+        print(f"Candidate clusters matching a different current ID (candidate -> current): {relabeled}")
+
+    print("\nPopulation shift per cluster ID:")
+    current_counts = churn.sum(axis=1)
+    candidate_counts = churn.sum(axis=0)
+    for cluster in range(max(k_current, k_candidate)):
+        before = int(current_counts[cluster]) if cluster < k_current else 0
+        after = int(candidate_counts[cluster]) if cluster < k_candidate else 0
+        print(f"  Cluster {cluster + 1}: {before:>12,} -> {after:>12,} ({(after - before) / total:+.2%})")
+
+    print(f"\nWall time: {result['elapsed_seconds']:.2f}s ({total / result['elapsed_seconds']:,.0f} vectors/s end to end)")
+    for name in ("current", "candidate"):
+        sizes, seconds = np.array(result["chunk_seconds"][name]).T
+        # Batch timings exist only per chunk, so report chunk wall time rather than per-vector percentiles
+        chunk_ms = seconds * 1e3
+        print(
+            f"  {name:>9} batch predict: {sizes.sum() / seconds.sum():,.0f} vectors/s per worker "
+            f"(mean {seconds.sum() / sizes.sum() * 1e6:.3f}us/vector), "
+            f"per-chunk wall time p50 {np.percentile(chunk_ms, 50):.1f}ms, p99 {np.percentile(chunk_ms, 99):.1f}ms "
+            f"(~{int(np.median(sizes)):,} vectors/chunk)"
+        )
+        if result["single_latency"] is not None:
+            single_ms = result["single_latency"][name] * 1e3
+            print(
+                f"  {name:>9} single predict: p50 {np.percentile(single_ms, 50):.3f}ms, "
+                f"p99 {np.percentile(single_ms, 99):.3f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay questionnaire vectors against the current and a candidate K-Means model.")
+    parser.add_argument("candidate", help="Path to the candidate model .pkl")
+    parser.add_argument("--current", default=None, help="Path to the current model .pkl (defaults to the published model)")
+    parser.add_argument("--source", choices=["db", "synthetic"], default="db", help="Replay logged submissions or synthetic vectors")
+    parser.add_argument("--synthetic-count", type=int, default=1_000_000, help="Number of synthetic vectors to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    if args.current is None:
+        manifest = load_published_manifest()
+        args.current = manifest["model_path"] if manifest else CURRENT_MODEL_PATH
+
+    if args.source == "synthetic":
+        result = shadow_score(
+            iter_synthetic_chunks(args.synthetic_count, args.chunk_size, args.seed),
+            args.current, args.candidate, args.workers,
+        )
+        print_report(result)
+    else:
+        db = SessionLocal()
+        try:
+            result = shadow_score(iter_db_chunks(db, args.chunk_size), args.current, args.candidate, args.workers)
+            print_report(result)
+        finally:
+            db.close()
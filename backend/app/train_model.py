@@ -5,22 +5,33 @@ from sqlalchemy.orm import Session
 from . import models
 from .database import SessionLocal
 import json
+import os
 
 # Number of clusters (k) - based on our archetypes
 NUM_CLUSTERS = 8
 MODEL_PATH = "ml_models/kmeans_model.pkl"
+# Written by pipeline.py; the API prefers it over MODEL_PATH while it exists
+PUBLISHED_MANIFEST_PATH = "ml_models/published.json"
+
+def fit_kmeans_model(user_response_matrix):
+    """Trains a K-Means model on a (users x 15) response matrix."""
+    print(f"Training K-Means model with {len(user_response_matrix)} users and {NUM_CLUSTERS} clusters...")
+    kmeans = KMeans(n_clusters=NUM_CLUSTERS, random_state=42, n_init=10)
+    kmeans.fit(user_response_matrix)
+    return kmeans
 
 def train_and_save_kmeans_model(db: Session):
     """
     Loads synthetic user responses, trains a K-Means model,
     saves the model, and stores cluster info in the database.
+    Returns True if a model was trained and saved.
     """
     # 1. Load all synthetic user responses from the database
     user_responses_data = db.query(models.UserResponse).all()
     
     if not user_responses_data:
         print("No user response data found in the database. Please generate synthetic data first.")
-        return
+        return False
 
     # Convert to DataFrame for easier processing
     df_responses = pd.DataFrame([
@@ -41,11 +52,8 @@ def train_and_save_kmeans_model(db: Session):
     user_response_matrix = user_response_matrix.reindex(sorted(user_response_matrix.columns), axis=1)
 
 
-    print(f"Training K-Means model with {len(user_response_matrix)} users and {NUM_CLUSTERS} clusters...")
-    
     # 3. Initialize and train a K-Means model
-    kmeans = KMeans(n_clusters=NUM_CLUSTERS, random_state=42, n_init=10)
-    kmeans.fit(user_response_matrix)
+    kmeans = fit_kmeans_model(user_response_matrix)
 
     # 4. Save the trained K-Means model to a .pkl file
     import os
@@ -74,10 +82,15 @@ def train_and_save_kmeans_model(db: Session):
         db.add(cluster)
     db.commit()
     print(f"Stored {NUM_CLUSTERS} cluster centroids and info in the database.")
+    return True
 
 if __name__ == "__main__":
     db = SessionLocal()
     try:
-        train_and_save_kmeans_model(db)
+        model_saved = train_and_save_kmeans_model(db)
     finally:
         db.close()
+    # Hand control back to MODEL_PATH and the clusters table, otherwise the API keeps serving the pipeline's model
+    if model_saved and os.path.exists(PUBLISHED_MANIFEST_PATH):
+        os.remove(PUBLISHED_MANIFEST_PATH)
+        print(f"Removed {PUBLISHED_MANIFEST_PATH}; restart the API server to load {MODEL_PATH}.")